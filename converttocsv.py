@@ -1,57 +1,103 @@
 """
 The files are in a variety of formats. This script will convert all to pdf.
 """
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from glob import glob
+import argparse
+import logging
+import os
 import shutil
 
 import pandas as pd
 import tabula
 import odf
 
+log = logging.getLogger(__name__)
+
+def write_sheets(sheets, filename, ext, dirname, executor):
+    """
+    Write each sheet of a workbook to its own csv file, numbered from 1. The writes run on the
+    executor and this returns once all of them are done.
+
+    Args:
+        sheets (dict) -- sheet name to pd.DataFrame, as returned by pd.read_excel
+        filename (str) -- name of the workbook
+        ext (str) -- extension of the workbook, which is replaced with csv
+        dirname (str) -- directory to save the csv files in
+        executor (ThreadPoolExecutor)
+    """
+    futures = []
+    for i, d in enumerate(sheets.values(), 1):
+        outfile = f"{dirname}/{i}_" + filename.replace(ext, "csv")
+        log.debug(outfile)
+        futures.append(executor.submit(d.to_csv, outfile))
+    for future in futures:
+        future.result()
+
+
+def pdf_to_csv(filename, dirname):
+    """
+    Write the table on the first page of a pdf file to a csv file. This runs in a worker process,
+    where logging may not be set up, so it leaves logging to the caller.
+
+    Args:
+        filename (str) -- name of pdf file
+        dirname (str) -- directory to save the csv file in
+
+    Returns:
+        name of the csv file
+    """
+    df = tabula.read_pdf(filename, pages=1)[0]
+    outfile = f"{dirname}/1_" + filename.replace("pdf", "csv")
+    df.to_csv(outfile)
+    return outfile
+
+
 def main():
     """
     Convert all files to csv files, saved in directory csvfiles.
     """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="number of pdf files to convert at the same time")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
     dirname = "csvfiles"
 
-    # old excel files
-    for filename in glob("*xls"):
-        print(filename)
-        df = pd.read_excel(filename, sheet_name=None)
-        for i, d in enumerate(df.values(), 1):
-            outfile = f"{dirname}/{i}_" + filename.replace("xls", "csv")
-            print(outfile)
-            d.to_csv(outfile)
-
-    # modern excel files
-    for filename in glob("*xlsx"):
-        print(filename)
-        df = pd.read_excel(filename, sheet_name=None)
-        for i, d in enumerate(df.values(), 1):
-            outfile = f"{dirname}/{i}_" + filename.replace("xlsx", "csv") 
-            print(outfile)
-            d.to_csv(outfile)
-
-    # open office files
-    for filename in glob("*ods"):
-        print(filename)
-        df = pd.read_excel(filename, sheet_name=None, engine="odf")
-        for i, d in enumerate(df.values(), 1):
-            outfile = f"{dirname}/{i}_" + filename.replace("ods", "csv")
-            print(outfile)
-            d.to_csv(outfile)
-
-    # pdf files, 1 table per file
-    for filename in glob("*pdf"):
-        print(filename)
-        df = tabula.read_pdf(filename, pages=1)[0]
-        outfile = f"{dirname}/1_" + filename.replace("pdf", "csv")
-        print(outfile)
-        df.to_csv(f"{dirname}/1_" + filename.replace("pdf", "csv"))
+    # sheets of a workbook are independent, so write them to csv in parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as writer:
+        # old excel files
+        for filename in glob("*xls"):
+            log.info(filename)
+            df = pd.read_excel(filename, sheet_name=None, engine="xlrd")
+            write_sheets(df, filename, "xls", dirname, writer)
+
+        # modern excel files, the openpyxl engine opens the workbook read only
+        for filename in glob("*xlsx"):
+            log.info(filename)
+            df = pd.read_excel(filename, sheet_name=None, engine="openpyxl")
+            write_sheets(df, filename, "xlsx", dirname, writer)
+
+        # open office files
+        for filename in glob("*ods"):
+            log.info(filename)
+            df = pd.read_excel(filename, sheet_name=None, engine="odf")
+            write_sheets(df, filename, "ods", dirname, writer)
+
+    # pdf files, 1 table per file. Each file gets its own java process from tabula, so convert
+    # them in parallel
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = []
+        for filename in glob("*pdf"):
+            log.info(filename)
+            futures.append(executor.submit(pdf_to_csv, filename, dirname))
+        for future in futures:
+            log.debug(future.result())
 
     # copy csv files
     for filename in glob("*csv"):
-        print(filename)
+        log.info(filename)
         shutil.copyfile(filename, f"1_{dirname}/{filename}")
 
 if __name__ == "__main__":
@@ -29,20 +29,29 @@ Target columns are:
 """
 from glob import glob
 import argparse
+import logging
 import re
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 COLUMNS = ["Name - First", "Name - Last", "Email Address", "Phone Number", "Mailing Address",
            "City", "State", "Zip", "Alternate name", "Alt email", "Alt phone"]
+# kept as a plain string, pandas only hands uncompiled patterns to the arrow string kernels
+NONDIGIT = r"\D"
+# all fields are text, arrow backed strings keep the .str methods out of python loops
+STRING = "string[pyarrow]"
+
+log = logging.getLogger(__name__)
 
 
 def make_headers_lowercase(df):
     """
     Make all headers lowercase.
     """
-    df.columns = [x.lower().strip().strip("*") for x in df.columns]
+    df.columns = df.columns.str.lower().str.strip().str.strip("*")
 
 
 def make_first_last(df):
@@ -67,11 +76,11 @@ def unify_email(df):
     """
     Any header with email in it will be shortened to "email".
     """
-    df.columns = ["email" if "email" in x else x for x in df.columns]
+    df.columns = df.columns.where(~df.columns.str.contains("email", regex=False), "email")
     if not "email" in df.columns:
         return
-    df["email"] = df["email"].apply(lambda x: x.strip().replace("+AEA-", "@"))
-    df["email"] = df["email"].apply(lambda x: "" if not "@" in x else x)
+    df["email"] = df["email"].str.strip().str.replace("+AEA-", "@", regex=False)
+    df.loc[~df["email"].str.contains("@", regex=False, na=False), "email"] = ""
 
 def format_phone(phone):
     """
@@ -80,7 +89,7 @@ def format_phone(phone):
     Args:
         phone (str) -- phone number in random format
     """
-    formatted = re.sub("\D", "", phone)
+    formatted = re.sub(NONDIGIT, "", phone)
     if not formatted:
         return ""
     return "-".join([formatted[:3], formatted[3:6], formatted[6:]])
@@ -92,20 +101,24 @@ def unify_phone(df):
     Returns:
         new df, this cannot make all operations in place
     """
-    df.columns = ["phone" if "phone" in x else x for x in df.columns]
+    df.columns = df.columns.where(~df.columns.str.contains("phone", regex=False), "phone")
     if not "phone" in df.columns:
         return df
     # there is a set of files with some entries containing two phone numbers in a cell
     # these entries are all in the format (000) 000-0000, so create a new row with the second
     # phone number if there are two "(" in the cell. Some entries have text in addition to the
-    # numbers, so strip that out. The format function will add in hyphens
-    twonums = df["phone"].apply(lambda x: x.count("(") > 1)
-    df2 = df[twonums].copy()
-    df2["phone"] = df2["phone"].apply(lambda x: re.sub("\D", "", x[15:]))
-    df["phone"] = df["phone"].apply(lambda x: x[:15])
-    # attempt to unify format
-    combined = df.append(df2, ignore_index=True)
-    combined["phone"] = combined["phone"].apply(lambda x: format_phone(x))
+    # numbers, so strip that out. Hyphens are added below, in the same format as format_phone
+    twonums = df["phone"].str.count(r"\(") > 1
+    second = df.loc[twonums, "phone"].str.slice(15).str.replace(NONDIGIT, "", regex=True)
+    df["phone"] = df["phone"].str.slice(0, 15)
+    # attempt to unify format, only cells with digits left get hyphens. Phone columns are often
+    # mostly empty, so only the filled in cells are formatted and the rest are left as ""
+    combined = pd.concat([df, df.loc[twonums].assign(phone=second)], ignore_index=True)
+    phones = combined["phone"]
+    digits = phones[phones.str.len() > 0].str.replace(NONDIGIT, "", regex=True)
+    digits = digits[digits.str.len() > 0]
+    formatted = digits.str.slice(0, 3) + "-" + digits.str.slice(3, 6) + "-" + digits.str.slice(6)
+    combined["phone"] = formatted.reindex(combined.index, fill_value="")
     return combined
 
 
@@ -118,65 +131,80 @@ def zip_to_zipcode(df):
     df.columns = [x.replace("/province", "") for x in df.columns]
 
 
-def add_addresses(row, table):
+def combine_address_lines(df):
     """
-    Add addresses from row into table. Names in row should have been unified already with the
-    functions above.
+    Combine "* address 1" and "* address 2" into a single "* address" column, with the lines
+    separated by a space.
+    """
+    for address_name in [x for x in df.columns if "address" in x and "1" in x]:
+        address2 = address_name.replace("1", "2")
+        df[address_name.strip(" 1")] = df[address_name].str.cat(df[address2], sep=" ", na_rep="")
+        df.drop(columns=[address_name, address2], inplace=True)
+
+
+def address_columns(cols):
+    """
+    Find the columns of each address in a file. Address lines 1 and 2 should have been combined
+    already with combine_address_lines.
 
     Args:
-        row (pd.Series)
-        table (Table)
+        cols (dict) -- column name to position in the row tuples
+
+    Returns:
+        list with one dict per address, mapping "address", "city", "state" and "zipcode" to
+        column positions
     """
     address_parts = ["address", "city", "state", "zipcode"]
-    first = row["first name"]
-    last = row["last name"]
-
-    address_names = {x for x in row.index if "address" in x}
-    # combine address lines 1 and 2
-  
-    add = set()
-    remove = set()
-    for address_name in address_names:
-        if "1" in address_name:
-            address2 = address_name.replace("1", "2")
-            row[address_name.strip(" 1")] = f"{row[address_name]} {row[address2]}"
-            add.add(address_name.strip(" 1"))
-            remove = remove.union([address_name, address2])
-    address_names -= remove
-    address_names = address_names.union(add)
-        
-    for address_name in address_names:
+    addr_meta = []
+    for address_name in {x for x in cols.keys() if "address" in x}:
         splitname = address_name.split(" ")
         if len(splitname) == 1:
-            address = {ap:row[ap] for ap in address_parts}
+            addr_meta.append({ap:cols[ap] for ap in address_parts})
         else:
-            address = {ap:row[" ".join([splitname[0], ap])] for ap in address_parts}
-        table.add(first, last, **address)
+            addr_meta.append({ap:cols[" ".join([splitname[0], ap])] for ap in address_parts})
+    return addr_meta
+
+
+def add_addresses(tup, cols, addr_meta, table):
+    """
+    Add addresses from row into table. Names in row should have been unified already with the
+    functions above.
+
+    Args:
+        tup (tuple) -- row values, as given by DataFrame.itertuples(index=False, name=None)
+        cols (dict) -- column name to position in tup
+        addr_meta (list) -- address columns, as returned by address_columns
+        table (Table)
+    """
+    first = tup[cols["first name"]]
+    last = tup[cols["last name"]]
+    for address in addr_meta:
+        table.add(first, last, **{ap:tup[i] for ap, i in address.items()})
 
 
 class Table:
     """
     Rather than try to do a bunch of complicated merging and de-duping with pandas, the entries
-    will be added one at a time to the dataframe. Clarity is more important than efficiency for
-    this project. This class will manage the merging.
+    will be added one at a time and looked up by lowercased first and last name. The dataframe is
+    only built once all entries have been added. This class will manage the merging.
 
     Alternate names will not be dealt with here, matching will require manual effort. But the
     column is included so at least the final spreadsheet will have it.
     """
     def __init__(self):
-        self.data = pd.DataFrame(columns=COLUMNS)
-
-    def __getitem__(self, row_col_tup):
-        """
-        Index into self.data with a row index or a tuple of (row_index, column_index).
-        """
-        return self.data.iloc[row_col_tup]
-
-    def __setitem__(self, row_col_tup, val):
+        # rows are kept as lists in COLUMNS order and only turned into self.data once everything
+        # has been added; index maps lowercased (first, last) to the position in self.rows
+        self.rows = []
+        self.index = {}
+        self.data = None
+        # entries that could not be merged, these are logged once everything has been added
+        self.warnings = []
+
+    def make_dataframe(self):
         """
-        Set value in self.data with a tuple of (row_index, column_index).
+        Build self.data from all the entries added so far.
         """
-        self.data.iloc[row_col_tup] = val
+        self.data = pd.DataFrame(self.rows, columns=COLUMNS, dtype=STRING)
 
     def add(self, first=None, last=None, email=None, phone=None, address=None, city=None,
             state=None, zipcode=None):
@@ -186,51 +214,48 @@ class Table:
         entries to consider merging.
 
         If an entry with first and last exists, contact information will be compared and added
-        where possible. If all slots are full, a message will be printed.
+        where possible. If all slots are full, a message will be added to self.warnings.
         """
-        firstmatch = self.data["Name - First"].apply(lambda s: s.lower()) == first.lower()
-        lastmatch = self.data["Name - Last"].apply(lambda s: s.lower()) == last.lower()
-        entrymask = firstmatch & lastmatch
-        if not sum(entrymask):
-            self.data = self.data.append({COLUMNS[0]:first, COLUMNS[1]:last, COLUMNS[2]:email,
-                                          COLUMNS[3]:phone, COLUMNS[4]:address, COLUMNS[5]:city,
-                                          COLUMNS[6]:state, COLUMNS[7]:zipcode, COLUMNS[8]:None,
-                                          COLUMNS[9]:None, COLUMNS[10]:None}, ignore_index=True)
+        key = (first.lower(), last.lower())
+        if key not in self.index:
+            self.rows.append([first, last, email, phone, address, city, state, zipcode, None,
+                              None, None])
+            self.index[key] = len(self.rows) - 1
             return
-        if sum(entrymask) > 1:
-            raise ValueError(f"multiple entries exist for {first} {last}")
-        rowi = np.where(entrymask)[0][0]
+        row = self.rows[self.index[key]]
         if email and email is not None:
             # no email in existing entry, add new one
-            if not self[rowi, 2] or self[rowi, 2] is None:
-                self[rowi, 2] = email
+            if not row[2] or row[2] is None:
+                row[2] = email
             # email doesn't match, save as alt if not taken
-            elif self[rowi, 2] != email:
-                if self[rowi, -2] is None:
-                    self[rowi, -2] = email
+            elif row[2] != email:
+                if row[9] is None:
+                    row[9] = email
                 # if the alt exists and is same as new one, continue
-                elif self[rowi, -2] != email:
-                    print(f"Two emails already exist for {first} {last}, cannot add {email}")
+                elif row[9] != email:
+                    self.warnings.append(
+                        f"Two emails already exist for {first} {last}, cannot add {email}")
 
         # repeat for phone
         if phone and phone is not None:
             # no phone in existing entry, add new one
-            if not self[rowi, 3] or self[rowi, 3] is None:
-                self[rowi, 3] = phone
+            if not row[3] or row[3] is None:
+                row[3] = phone
             # phone doesn't match, save as alt if not taken
-            elif self[rowi, 3] != phone:
-                if self[rowi, -1] is None:
-                    self[rowi, -1] = phone
+            elif row[3] != phone:
+                if row[10] is None:
+                    row[10] = phone
                 # if the alt exists and is same as new one, continue
-                elif self[rowi, -1] != phone:
-                    print(f"Two phone numbers already exist for {first} {last}, cannot add {phone}")
+                elif row[10] != phone:
+                    self.warnings.append(
+                        f"Two phone numbers already exist for {first} {last}, cannot add {phone}")
 
         # add address, newer address will over-write older one
         if address and not address is None:
-            self[rowi, 4] = address
-            self[rowi, 5] = city
-            self[rowi, 6] = state
-            self[rowi, 7] = zipcode
+            row[4] = address
+            row[5] = city
+            row[6] = state
+            row[7] = zipcode
 
 
 def get_files_in_chron_order(csvfiledir):
@@ -257,30 +282,42 @@ def main():
     parser.add_argument("csvdir", type=str, help="path to directory containing csv files")
     parser.add_argument("outfile", type=str, help="name, including path, for output csv file")
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
     table = Table()
     for csvfile in get_files_in_chron_order(args.csvdir):
-        print(csvfile)
-        curr = pd.read_csv(csvfile)
-        curr.fillna("", inplace=True)
+        log.info(csvfile)
+        # read everything as text so zip codes and phone numbers are not turned into numbers, and
+        # leave missing cells as empty strings
+        curr = pd.read_csv(csvfile, dtype=STRING, keep_default_na=False, na_filter=False,
+                           engine="c")
         make_headers_lowercase(curr)
         make_first_last(curr)
         unify_email(curr)
         curr = unify_phone(curr)
         zip_to_zipcode(curr)
-        for _, row in curr.iterrows():
-            email = row["email"] if "email" in row.index else ""
-            phone = row["phone"] if "phone" in row.index else ""
-            table.add(row["first name"], row["last name"], email.strip(), phone.strip())
-            add_addresses(row, table)
+        combine_address_lines(curr)
+        cols = {c:i for i, c in enumerate(curr.columns)}
+        addr_meta = address_columns(cols)
+        for tup in curr.itertuples(index=False, name=None):
+            email = tup[cols["email"]] if "email" in cols else ""
+            phone = tup[cols["phone"]] if "phone" in cols else ""
+            table.add(tup[cols["first name"]], tup[cols["last name"]], email.strip(), phone.strip())
+            add_addresses(tup, cols, addr_meta, table)
+    for warning in table.warnings:
+        log.warning(warning)
     # delete rows with no information other than the name, which tend to be not really people,
     # since spreadsheets have information other than contact information
     # to drop rows, need to use NaN as missing value
+    table.make_dataframe()
     table.data.replace("", np.nan, inplace=True)
     table.data.dropna(how="all", subset=table.data.columns[2:], inplace=True)
     table.data.dropna(how="all", subset=table.data.columns[:2], inplace=True)
     table.data.fillna("")
-    table.data.to_csv(args.outfile, index=False)
+    # pyarrow writes the text columns in C rather than converting them cell by cell. Unlike
+    # to_csv, it puts double quotes around the header and every non-empty text field
+    pacsv.write_csv(pa.Table.from_pandas(table.data, preserve_index=False), args.outfile,
+                    write_options=pacsv.WriteOptions(include_header=True))
 
 
 if __name__ == "__main__":